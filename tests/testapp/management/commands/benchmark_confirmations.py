@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from shop.models.ordermodel import Order
+from viveum.forms import ConfirmationForm
+from viveum.models import Confirmation, PaymentStatistic
+from viveum.offsite_backend import OffsiteViveumBackend
+
+BENCHMARK_BRAND = 'BENCHMARK'  # keeps the benchmark's aggregates apart from real ones
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row against batched ingestion of confirmations under concurrent load.'
+    option_list = BaseCommand.option_list + (
+        make_option('--confirmations', type='int', default=1000,
+            help='Number of confirmations to store per run'),
+        make_option('--threads', type='int', default=50,
+            help='Number of concurrent request threads'),
+        make_option('--batch-size', type='int', default=100,
+            help='Maximum number of confirmations per batch'),
+        make_option('--max-delay', type='float', default=0.05,
+            help='Maximum seconds a confirmation waits for its batch'),
+    )
+
+    def handle(self, *args, **options):
+        backend = OffsiteViveumBackend(shop=None)
+        order = Order.objects.create(status=Order.CANCELLED)
+        try:
+            per_row = self.run(backend, order, options, BATCH_CONFIRMATIONS=False)
+            batched = self.run(backend, order, options, BATCH_CONFIRMATIONS=True,
+                BATCH_SIZE=options['batch_size'], BATCH_MAX_DELAY=options['max_delay'])
+        finally:
+            Confirmation.objects.filter(order=order).delete()
+            PaymentStatistic.objects.filter(brand=BENCHMARK_BRAND).delete()
+            order.delete()
+        self.stdout.write('per-row: %8.1f confirmations/s, %d failed\n' % per_row)
+        self.stdout.write('batched: %8.1f confirmations/s, %d failed\n' % batched)
+
+    def run(self, backend, order, options, **viveum_settings):
+        """
+        Store confirmations from concurrent threads, using the same code path as the
+        payment views. Returns the rate of successfully stored confirmations and the
+        number of failed ones.
+        """
+        remaining = range(options['confirmations'])
+        failures = []
+        lock = threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if not remaining:
+                            return
+                        payid = remaining.pop()
+                    confirmation = ConfirmationForm({'order': order.pk, 'orderid': order.pk,
+                        'status': 9, 'acceptance': 'test123', 'payid': payid, 'ncerror': 0,
+                        'cn': 'John Doe', 'amount': '1.23', 'currency': 'EUR',
+                        'cardno': 'XXXXXXXXXXXX1111', 'brand': BENCHMARK_BRAND,
+                        'origin': 'benchmark', 'shasign': 'X' * 40})
+                    confirmation.is_valid()
+                    try:
+                        backend._save_confirmation(confirmation)
+                    except Exception as exception:
+                        with lock:
+                            failures.append(exception)
+            finally:
+                connection.close()
+
+        with override_settings(VIVEUM_PAYMENT=dict(settings.VIVEUM_PAYMENT, **viveum_settings)):
+            threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            start = time.time()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.time() - start
+        if failures:
+            self.stderr.write('%d confirmations failed, first error: %s\n' % (len(failures), failures[0]))
+        return (options['confirmations'] - len(failures)) / elapsed, len(failures)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import timeit
+from optparse import make_option
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template import Template, RequestContext, context
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+PAGE_TEMPLATE = """
+<html><head><title>{{ title }}</title></head>
+<body>{% for item in items %}<p>{{ item }}</p>{% endfor %}</body>
+</html>
+"""
+
+
+class Command(BaseCommand):
+    help = 'Compare rendering non-payment pages with and without the viveum context processor.'
+    option_list = BaseCommand.option_list + (
+        make_option('--pages', type='int', default=10000,
+            help='Number of pages to render per run'),
+    )
+
+    def handle(self, *args, **options):
+        processors = tuple(p for p in settings.TEMPLATE_CONTEXT_PROCESSORS
+                           if p != 'viveum.context_processors.viveum')
+        without = self.run(processors, options['pages'])
+        with_viveum = self.run(processors + ('viveum.context_processors.viveum',), options['pages'])
+        self.stdout.write('without viveum context processor: %8.1f pages/s\n' % without)
+        self.stdout.write('with viveum context processor:    %8.1f pages/s\n' % with_viveum)
+
+    def run(self, processors, pages):
+        template = Template(PAGE_TEMPLATE)
+        request = RequestFactory().get('/')
+        with override_settings(TEMPLATE_CONTEXT_PROCESSORS=processors):
+            context._standard_context_processors = None
+            elapsed = timeit.timeit(lambda: template.render(RequestContext(request,
+                {'title': 'Product', 'items': range(10)})), number=pages)
+        context._standard_context_processors = None
+        return pages / elapsed
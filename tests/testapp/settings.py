@@ -10,9 +10,16 @@ DATABASES = {
         'PASSWORD': '',
         'HOST': '',
         'PORT': '',
+        'TEST_NAME': 'test-default.sqlite',  # file based, so that background threads share it
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': 'test-replica.sqlite',
     },
 }
 
+DATABASE_ROUTERS = ['viveum.routers.ConfirmationRouter']
+
 SITE_ID = 1
 
 STATIC_URL = '/static/'
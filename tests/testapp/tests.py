@@ -1,13 +1,21 @@
 # -*- coding: utf-8 -*-
+import base64
+import hashlib
+import os
 import requests
 import time
 import urlparse
 from pyquery.pyquery import PyQuery
 import random
+import threading
 from decimal import Decimal
-from django.test import LiveServerTestCase
+from django.test import LiveServerTestCase, TestCase, TransactionTestCase
 from django.test.client import Client, RequestFactory
+from django.test.utils import override_settings
+from django.contrib import admin
 from django.conf import settings
+from django.template import context
+from django.db import connection, DatabaseError, IntegrityError
 from django.core.urlresolvers import reverse, resolve
 from django.contrib.auth.models import User
 from shop.util.cart import get_or_create_cart
@@ -15,7 +23,14 @@ from shop.addressmodel.models import Country
 from shop.models.ordermodel import Order
 from shop.backends_pool import backends_pool
 from shop.tests.util import Mock
-from viveum.models import Confirmation
+from viveum.admin import PaymentStatisticAdmin
+from viveum.batching import ConfirmationBuffer
+from viveum.forms import ConfirmationForm
+from viveum.inlining import AssetInliner
+from viveum.models import Confirmation, PaymentStatistic, CustomerAlias
+from viveum.offsite_backend import OffsiteViveumBackend
+from viveum.routers import reporting
+from viveum.views import PaymentZoneView
 from testapp.models import DiaryProduct
 
 
@@ -203,3 +218,378 @@ class ViveumTest(LiveServerTestCase):
     def test_template(self):
         httpresp = self.client.get(reverse('viveum_template'))
         self.assertContains(httpresp, '$$$PAYMENT ZONE$$$')
+
+
+class PaymentStatisticTest(TestCase):
+    def setUp(self):
+        self.order = Order.objects.create(status=Order.CANCELLED)
+
+    def create_confirmation(self, status, ncerror, brand='VISA', amount=Decimal('1.23')):
+        return Confirmation.objects.create(order=self.order, status=status, payid=1,
+            ncerror=ncerror, cn='John Doe', amount=amount, currency='EUR',
+            cardno='XXXXXXXXXXXX1111', brand=brand, origin='acquirer')
+
+    def test_add_confirmations(self):
+        confirmations = [self.create_confirmation(9, 0), self.create_confirmation(9, 0),
+            self.create_confirmation(2, 30001001, brand='MasterCard')]
+        PaymentStatistic.objects.add_confirmations(confirmations[:1])
+        PaymentStatistic.objects.add_confirmations(confirmations[1:])
+        self.assertEqual(PaymentStatistic.objects.count(), 2)
+        visa = PaymentStatistic.objects.get(brand='VISA')
+        self.assertEqual(visa.day, self.order.created.date())
+        self.assertEqual(visa.count, 2)
+        self.assertEqual(visa.amount, Decimal('2.46'))
+        declined = PaymentStatistic.objects.get(brand='MasterCard')
+        self.assertEqual((declined.status, declined.ncerror, declined.count), (2, 30001001, 1))
+
+    def test_rebuild(self):
+        self.create_confirmation(9, 0)
+        self.create_confirmation(9, 0, amount=Decimal('2.00'))
+        PaymentStatistic.objects.create(day=self.order.created.date(), brand='VISA',
+            status=9, ncerror=0, currency='EUR', count=99, amount=Decimal('99'))
+        PaymentStatistic.objects.rebuild()
+        visa = PaymentStatistic.objects.get()
+        self.assertEqual(visa.count, 2)
+        self.assertEqual(visa.amount, Decimal('3.23'))
+
+    def test_save_confirmation(self):
+        backend = OffsiteViveumBackend(FakeShop(self.order))
+        for status, ncerror in ((9, 0), (2, 30001001)):
+            confirmation = ConfirmationForm({'order': self.order.pk, 'orderid': self.order.pk,
+                'status': status, 'payid': 1, 'ncerror': ncerror, 'cn': 'John Doe',
+                'amount': '1.23', 'currency': 'EUR', 'cardno': 'XXXXXXXXXXXX1111',
+                'brand': 'VISA', 'origin': 'acquirer', 'shasign': 'X' * 40})
+            self.assertTrue(confirmation.is_valid(), confirmation.errors)
+            backend._save_confirmation(confirmation)
+        self.assertEqual(Confirmation.objects.count(), 2)
+        accepted = PaymentStatistic.objects.get(status=9)
+        self.assertEqual((accepted.count, accepted.amount), (1, Decimal('1.23')))
+        declined = PaymentStatistic.objects.get(status=2)
+        self.assertEqual((declined.ncerror, declined.count), (30001001, 1))
+
+    def test_summary(self):
+        day = self.order.created.date()
+        for brand, status, ncerror, currency, count, amount in (
+                ('VISA', 9, 0, 'EUR', 3, '30.00'), ('MasterCard', 2, 30001001, 'EUR', 1, '5.00'),
+                ('VISA', 5, 0, 'CHF', 1, '7.00'), ('VISA', 1, 0, 'EUR', 1, '2.00')):
+            PaymentStatistic.objects.create(day=day, brand=brand, status=status, ncerror=ncerror,
+                currency=currency, count=count, amount=Decimal(amount))
+        viveum_payment = dict(settings.VIVEUM_PAYMENT, VALID_RETURN_STATUS=('5', '9'))
+        with override_settings(VIVEUM_PAYMENT=viveum_payment):
+            summary = PaymentStatisticAdmin(PaymentStatistic, admin.site) \
+                .get_summary(PaymentStatistic.objects.all())
+        self.assertEqual(summary['total_count'], 6)
+        self.assertEqual(summary['accepted_count'], 4)
+        self.assertAlmostEqual(summary['acceptance_rate'], 100.0 * 4 / 6)
+        self.assertEqual(summary['brand_mix'], [('VISA', 5), ('MasterCard', 1)])
+        self.assertEqual(summary['decline_reasons'], [(30001001, 1)])
+        self.assertEqual(summary['volumes'], [('CHF', Decimal('7.00')), ('EUR', Decimal('30.00'))])
+
+
+class PaymentZoneTest(TestCase):
+    def test_inlined_template(self):
+        viveum_payment = dict(settings.VIVEUM_PAYMENT, INLINE_PAYMENT_ZONE=True)
+        with override_settings(VIVEUM_PAYMENT=viveum_payment):
+            httpresp = self.client.get(reverse('viveum_template'))
+        self.assertContains(httpresp, '$$$PAYMENT ZONE$$$')
+        self.assertContains(httpresp, 'td.ncolh1{')
+        self.assertNotContains(httpresp, 'Dynamic Template Page')
+
+    def test_inlined_assets(self):
+        viveum_payment = dict(settings.VIVEUM_PAYMENT, INLINE_PAYMENT_ZONE=True,
+                              INLINE_IMAGE_MAX_SIZE=100)
+        view = PaymentZoneView.as_view(template_name='testapp/payment_zone_assets.html')
+        request = RequestFactory().get(reverse('viveum_template'))
+        with override_settings(VIVEUM_PAYMENT=viveum_payment):
+            httpresp = view(request)
+        static_dir = os.path.join(os.path.dirname(__file__), 'static', 'testapp')
+        with open(os.path.join(static_dir, 'small.png'), 'rb') as fh:
+            small_png = 'data:image/png;base64,' + base64.b64encode(fh.read())
+        self.assertContains(httpresp, '$$$PAYMENT ZONE$$$')
+        self.assertContains(httpresp, '<style type="text/css">body{background: url(%s);}</style>' % small_png)
+        self.assertContains(httpresp, '<style type="text/css" media="print">body{color: black;}</style>')
+        self.assertContains(httpresp, '<img src="%s">' % small_png)
+        self.assertContains(httpresp, '<img src="http://testserver/static/testapp/large.png">')
+        self.assertContains(httpresp, 'href="https://cdn.example.com/remote.css"')
+        self.assertContains(httpresp, '<img src="https://cdn.example.com/remote.png">')
+        self.assertNotContains(httpresp, 'stylesheet of the payment zone')
+
+    def test_failed_inlining(self):
+        request = RequestFactory().get(reverse('viveum_template'))
+        html = '<link rel="stylesheet" href="/static/testapp/latin1.css">\n$$$PAYMENT ZONE$$$'
+        self.assertEqual(AssetInliner(request).inline(html), html)
+
+
+class FakeShop(object):
+    def __init__(self, order):
+        self.order = order
+
+    def get_order(self, request):
+        return self.order
+
+    def get_order_total(self, order):
+        return order.order_total
+
+    def confirm_payment(self, order, amount, transaction_id, payment_method):
+        order.status = Order.COMPLETED
+        order.save()
+
+    def get_finished_url(self):
+        return '/finished/'
+
+    def get_cancel_url(self):
+        return '/cancel/'
+
+
+class FakePSP(object):
+    """
+    Plays the part of the PSP in the orderstandard protocol. It verifies the SHA-IN
+    signature over all parameters it receives and answers with a signed redirection
+    to the accept URL, issuing an alias if the shop asked for one.
+    """
+    def get_sha_sign(self, params, passphrase):
+        values = ['%s=%s%s' % (key, params[key], passphrase) for key in sorted(params) if params[key]]
+        return hashlib.sha1(''.join(values).encode('utf8')).hexdigest().upper()
+
+    def pay(self, form_dict, issued_alias):
+        params = dict((key, value) for key, value in form_dict.iteritems() if key != 'SHASIGN')
+        if form_dict['SHASIGN'] != self.get_sha_sign(params, settings.VIVEUM_PAYMENT.get('SHA1_IN_SIGNATURE')):
+            raise AssertionError('Fake PSP received a divergent SHA-IN signature')
+        answer = {
+            'ORDERID': form_dict['ORDERID'],
+            'AMOUNT': '%.2f' % (form_dict['AMOUNT'] / 100.0),
+            'CURRENCY': form_dict['CURRENCY'],
+            'STATUS': '9',
+            'PAYID': '12345678',
+            'NCERROR': '0',
+            'ACCEPTANCE': 'test123',
+            'CN': 'John Doe',
+            'CARDNO': 'XXXXXXXXXXXX1111',
+            'BRAND': 'VISA',
+            'IP': '127.0.0.1',
+            'ALIAS': form_dict.get('ALIAS') or issued_alias,
+        }
+        answer['SHASIGN'] = self.get_sha_sign(answer, settings.VIVEUM_PAYMENT.get('SHA1_OUT_SIGNATURE'))
+        return answer
+
+
+class AliasPaymentTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='alias', email='alias@example.com')
+        self.factory = RequestFactory()
+        self.fake_psp = FakePSP()
+        self.viveum_payment = dict(settings.VIVEUM_PAYMENT, USE_ALIAS=True,
+            ALIAS_USAGE='Your card for future payments', VALID_RETURN_STATUS=('5', '9'))
+
+    def pay_order(self, store_alias=None):
+        order = Order.objects.create(user=self.user, status=Order.CONFIRMED,
+            order_subtotal=Decimal('1.23'), order_total=Decimal('1.23'))
+        backend = OffsiteViveumBackend(FakeShop(order))
+        if store_alias:
+            backend._store_alias = store_alias
+        request = self.factory.get('/')
+        request.user = self.user
+        form_dict = backend.get_form_dict(request)
+        backend.sign_form_dict(form_dict)
+        request = self.factory.get(reverse('viveum_accept'),
+            self.fake_psp.pay(form_dict, issued_alias='PSPALIAS1'))
+        httpresp = backend.return_success_view(request, 'acquirer')
+        self.assertEqual(httpresp.status_code, 302)
+        self.assertEqual(Order.objects.get(pk=order.pk).status, Order.COMPLETED)
+        return form_dict
+
+    def test_alias_payments(self):
+        with override_settings(VIVEUM_PAYMENT=self.viveum_payment):
+            form_dict = self.pay_order()
+            self.assertEqual(form_dict['ALIASOPERATION'], 'BYPSP')
+            self.assertFalse('ALIAS' in form_dict)
+            customer_alias = CustomerAlias.objects.get(user=self.user)
+            self.assertEqual(customer_alias.alias, 'PSPALIAS1')
+            self.assertEqual(customer_alias.brand, 'VISA')
+            form_dict = self.pay_order()
+            self.assertEqual(form_dict['ALIAS'], 'PSPALIAS1')
+            self.assertEqual(form_dict['ALIASUSAGE'], 'Your card for future payments')
+            self.assertFalse('ALIASOPERATION' in form_dict)
+        self.assertEqual(CustomerAlias.objects.count(), 1)
+
+    def test_failing_alias_storage(self):
+        def store_alias(confirmation):
+            raise IntegrityError('column user_id is not unique')
+
+        with override_settings(VIVEUM_PAYMENT=self.viveum_payment):
+            self.pay_order(store_alias=store_alias)
+        self.assertEqual(CustomerAlias.objects.count(), 0)
+
+
+class ConfirmationRouterTest(TestCase):
+    multi_db = True
+
+    def create_confirmation(self, order, using):
+        return Confirmation.objects.using(using).create(order=order, status=9, payid=1,
+            ncerror=0, cn='John Doe', amount=Decimal('1.23'), currency='EUR',
+            cardno='XXXXXXXXXXXX1111', brand='VISA', origin='acquirer')
+
+    def test_reporting_reads_from_replica(self):
+        viveum_payment = dict(settings.VIVEUM_PAYMENT, REPLICA_DATABASE='replica')
+        with override_settings(VIVEUM_PAYMENT=viveum_payment):
+            order = Order.objects.create(status=Order.CANCELLED)
+            self.create_confirmation(order, 'default')
+            self.create_confirmation(order, 'default')
+            self.create_confirmation(order, 'replica')
+            self.assertEqual(Confirmation.objects.count(), 2)
+            with reporting():
+                self.assertEqual(Confirmation.objects.count(), 1)
+                Confirmation.objects.create(order=order, status=9, payid=2, ncerror=0,
+                    cn='Jane Doe', amount=Decimal('1.23'), currency='EUR',
+                    cardno='XXXXXXXXXXXX1111', brand='VISA', origin='acquirer')
+                self.assertEqual(Confirmation.objects.count(), 1)
+            self.assertEqual(Confirmation.objects.count(), 3)
+        with reporting():
+            self.assertEqual(Confirmation.objects.count(), 3)
+
+
+class RecordingBuffer(ConfirmationBuffer):
+    def __init__(self, *args, **kwargs):
+        super(RecordingBuffer, self).__init__(*args, **kwargs)
+        self.batches = []
+
+    def _flush(self, batch):
+        self.batches.append(len(batch))
+        super(RecordingBuffer, self)._flush(batch)
+
+
+class BlockedBuffer(ConfirmationBuffer):
+    def __init__(self, *args, **kwargs):
+        super(BlockedBuffer, self).__init__(*args, **kwargs)
+        self.unblock = threading.Event()
+
+    def _flush(self, batch):
+        # simulates a flusher stuck on a database lock
+        self.unblock.wait(5)
+        super(BlockedBuffer, self)._flush(batch)
+
+
+class ConfirmationBufferTest(TransactionTestCase):
+    def setUp(self):
+        self.order = Order.objects.create(status=Order.CANCELLED)
+
+    def make_confirmation(self, payid):
+        return Confirmation(order=self.order, status=9, payid=payid, ncerror=0,
+            cn='John Doe', amount=Decimal('1.23'), currency='EUR',
+            cardno='XXXXXXXXXXXX1111', brand='VISA', origin='acquirer')
+
+    def start_saving(self, buf, instances):
+        errors = [None] * len(instances)
+
+        def save(index):
+            try:
+                buf.save(instances[index])
+            except Exception as exception:
+                errors[index] = exception
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=save, args=(k,)) for k in range(len(instances))]
+        for thread in threads:
+            thread.start()
+        return threads, errors
+
+    def save_in_threads(self, buf, instances):
+        threads, errors = self.start_saving(buf, instances)
+        for thread in threads:
+            thread.join(10)
+            self.assertFalse(thread.is_alive(), 'Request thread did not return')
+        return errors
+
+    def test_flush_on_batch_size(self):
+        buf = RecordingBuffer(batch_size=3, max_delay=60)
+        start = time.time()
+        errors = self.save_in_threads(buf, [self.make_confirmation(k) for k in range(3)])
+        self.assertLess(time.time() - start, 10)
+        self.assertEqual(errors, [None, None, None])
+        self.assertEqual(buf.batches, [3])
+        self.assertEqual(Confirmation.objects.count(), 3)
+
+    def test_flush_after_max_delay(self):
+        buf = RecordingBuffer(batch_size=100, max_delay=0.2)
+        start = time.time()
+        errors = self.save_in_threads(buf, [self.make_confirmation(1)])
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(errors, [None])
+        self.assertEqual(buf.batches, [1])
+        self.assertEqual(Confirmation.objects.count(), 1)
+
+    def test_flush_subsequent_partial_batches(self):
+        buf = RecordingBuffer(batch_size=10, max_delay=0.1, timeout=5)
+        self.assertEqual(self.save_in_threads(buf, [self.make_confirmation(1)]), [None])
+        time.sleep(0.2)
+        start = time.time()
+        self.assertEqual(self.save_in_threads(buf, [self.make_confirmation(2)]), [None])
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(buf.batches, [1, 1])
+        self.assertEqual(Confirmation.objects.count(), 2)
+
+    def test_failed_batch(self):
+        buf = ConfirmationBuffer(batch_size=3, max_delay=60)
+        instances = [self.make_confirmation(k) for k in range(3)]
+        instances[1].payid = None  # violates NOT NULL
+        errors = self.save_in_threads(buf, instances)
+        self.assertEqual(errors[0], None)
+        self.assertTrue(isinstance(errors[1], DatabaseError))
+        self.assertEqual(errors[2], None)
+        self.assertEqual(sorted(Confirmation.objects.values_list('payid', flat=True)), [0, 2])
+        # the flusher recovers after a failed batch
+        buf.batch_size = 1
+        self.assertEqual(self.save_in_threads(buf, [self.make_confirmation(4)]), [None])
+        self.assertEqual(Confirmation.objects.count(), 3)
+
+    def test_timeout_of_queued_entry(self):
+        buf = RecordingBuffer(batch_size=100, max_delay=60, timeout=0.2)
+        errors = self.save_in_threads(buf, [self.make_confirmation(1)])
+        self.assertEqual(errors, [None])
+        self.assertEqual(buf.batches, [])
+        self.assertEqual(Confirmation.objects.count(), 1)
+
+    def test_timeout_of_blocked_flusher(self):
+        buf = BlockedBuffer(batch_size=1, max_delay=0, timeout=0.2)
+        threads, errors = self.start_saving(buf, [self.make_confirmation(1)])
+        time.sleep(0.5)
+        # the entry already is being flushed, so its request keeps waiting for the outcome
+        self.assertTrue(threads[0].is_alive())
+        buf.unblock.set()
+        threads[0].join(10)
+        self.assertFalse(threads[0].is_alive(), 'Request thread did not return')
+        self.assertEqual(errors, [None])
+        self.assertEqual(Confirmation.objects.count(), 1)
+
+    def test_batched_save_confirmation(self):
+        backend = OffsiteViveumBackend(FakeShop(self.order))
+        confirmation = ConfirmationForm({'order': self.order.pk, 'orderid': self.order.pk,
+            'status': 9, 'payid': 1, 'ncerror': 0, 'cn': 'John Doe', 'amount': '1.23',
+            'currency': 'EUR', 'cardno': 'XXXXXXXXXXXX1111', 'brand': 'VISA',
+            'origin': 'acquirer', 'shasign': 'X' * 40})
+        self.assertTrue(confirmation.is_valid(), confirmation.errors)
+        viveum_payment = dict(settings.VIVEUM_PAYMENT, BATCH_CONFIRMATIONS=True, BATCH_MAX_DELAY=0)
+        with override_settings(VIVEUM_PAYMENT=viveum_payment):
+            backend._save_confirmation(confirmation)
+        self.assertEqual(Confirmation.objects.filter(order=self.order).count(), 1)
+
+
+class OrderFormTest(TestCase):
+    def test_order_standard_url_without_context_processor(self):
+        order = Order.objects.create(status=Order.CONFIRMED,
+            order_subtotal=Decimal('1.23'), order_total=Decimal('1.23'))
+        backend = OffsiteViveumBackend(FakeShop(order))
+        request = RequestFactory().get('/')
+        request.user = User.objects.create(username='order', email='order@example.com')
+        processors = tuple(p for p in settings.TEMPLATE_CONTEXT_PROCESSORS
+                           if p != 'viveum.context_processors.viveum')
+        url = 'https://psp.example.com/ncol/test/orderstandard_UTF8.asp'
+        viveum_payment = dict(settings.VIVEUM_PAYMENT, ORDER_STANDARD_URL=url)
+        with override_settings(VIVEUM_PAYMENT=viveum_payment, TEMPLATE_CONTEXT_PROCESSORS=processors):
+            context._standard_context_processors = None
+            try:
+                httpresp = backend.proceed_payment_view(request)
+            finally:
+                context._standard_context_processors = None
+        self.assertContains(httpresp, 'action="%s"' % url)
@@ -1,10 +1,82 @@
+from django.conf import settings
 from django.contrib import admin
-from models import Confirmation
+from django.db.models import Sum
+from models import Confirmation, PaymentStatistic, CustomerAlias
+from routers import reporting
 
 
-class ConfirmationAdmin(admin.ModelAdmin):
+class ReportingModelAdmin(admin.ModelAdmin):
+    """
+    Renders the change list inside a ``reporting()`` block, so that, if ConfirmationRouter
+    is installed, browsing does not compete with checkout traffic on the primary database.
+    """
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super(ReportingModelAdmin, self).changelist_view(request, extra_context)
+        with reporting():
+            response = super(ReportingModelAdmin, self).changelist_view(request, extra_context)
+            if hasattr(response, 'context_data') and 'cl' in response.context_data:
+                self.update_changelist_context(response.context_data)
+                response.render()
+        return response
+
+    def update_changelist_context(self, context):
+        pass
+
+
+class ConfirmationAdmin(ReportingModelAdmin):
     list_display = ('order', 'cn', 'status', 'amount')
     readonly_fields = ('order', 'status', 'acceptance', 'payid', 'merchant_comment',
         'ncerror', 'cn', 'amount', 'ipcty', 'currency', 'cardno', 'brand', 'origin')
 
 admin.site.register(Confirmation, ConfirmationAdmin)
+
+
+class PaymentStatisticAdmin(ReportingModelAdmin):
+    """
+    Dashboard for acceptance rate, decline reasons, brand mix and volume. It reads only
+    the aggregated rows, so its cost depends on the number of days, not of payments.
+    """
+    list_display = ('day', 'brand', 'status', 'ncerror', 'currency', 'count', 'amount')
+    list_filter = ('brand', 'currency', 'status')
+    date_hierarchy = 'day'
+    readonly_fields = list_display
+
+    def has_add_permission(self, request):
+        return False
+
+    def update_changelist_context(self, context):
+        context.update(self.get_summary(context['cl'].query_set))
+
+    def get_summary(self, queryset):
+        valid_return_status = settings.VIVEUM_PAYMENT.get('VALID_RETURN_STATUS', '5')
+        total = accepted = 0
+        brands, declines, volumes = {}, {}, {}
+        # clear the change list's ordering, otherwise its fields end up in GROUP BY
+        rows = queryset.order_by().values('brand', 'status', 'ncerror', 'currency') \
+            .annotate(total_count=Sum('count'), total_amount=Sum('amount'))
+        for row in rows:
+            total += row['total_count']
+            brands[row['brand']] = brands.get(row['brand'], 0) + row['total_count']
+            if str(row['status']).startswith(valid_return_status):
+                accepted += row['total_count']
+                volumes[row['currency']] = volumes.get(row['currency'], 0) + row['total_amount']
+            elif row['ncerror']:
+                declines[row['ncerror']] = declines.get(row['ncerror'], 0) + row['total_count']
+        return {
+            'total_count': total,
+            'accepted_count': accepted,
+            'acceptance_rate': 100.0 * accepted / total if total else None,
+            'brand_mix': sorted(brands.items(), key=lambda item: -item[1]),
+            'decline_reasons': sorted(declines.items(), key=lambda item: -item[1]),
+            'volumes': sorted(volumes.items()),
+        }
+
+admin.site.register(PaymentStatistic, PaymentStatisticAdmin)
+
+
+class CustomerAliasAdmin(admin.ModelAdmin):
+    list_display = ('user', 'brand', 'cardno')
+    readonly_fields = ('user', 'alias', 'brand', 'cardno')
+
+admin.site.register(CustomerAlias, CustomerAliasAdmin)
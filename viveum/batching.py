@@ -0,0 +1,140 @@
+#-*- coding: utf-8 -*-
+import logging
+import threading
+import time
+from django import db
+from django.conf import settings
+from django.db import connection, transaction, DatabaseError
+from models import Confirmation, PaymentStatistic
+
+
+class _PendingConfirmation(object):
+    """
+    A confirmation waiting in the buffer, together with the event its request thread
+    is blocked on until the batch holding it has been committed.
+    """
+    def __init__(self, instance):
+        self.instance = instance
+        self.flushed = threading.Event()
+        self.error = None
+
+
+class ConfirmationBuffer(object):
+    """
+    Coalesces the inserts of confirmations sent by the PSP into micro-batches.
+    Each request thread hands over its unsaved Confirmation and blocks, until a
+    background thread has written the batch holding it using one ``bulk_create``
+    and updated the payment statistics, both inside one transaction. A batch is
+    flushed as soon as it contains ``batch_size`` entries, or ``max_delay`` seconds
+    after its first entry arrived.
+    If a batch fails, its entries are retried one by one, so that only the offending
+    confirmation fails. If an entry still is queued after ``timeout`` seconds, it is
+    written directly. An entry already being flushed is waited for, as long as the
+    flusher thread is alive.
+    """
+    def __init__(self, batch_size=100, max_delay=0.05, timeout=10):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+        self._condition = threading.Condition()
+        self._pending = []
+        self._flusher = None
+
+    def save(self, instance):
+        """
+        Queue the given Confirmation instance and return after it has been stored.
+        Raises a DatabaseError, if this confirmation could not be stored.
+        """
+        entry = _PendingConfirmation(instance)
+        with self._condition:
+            self._start_flusher()
+            self._pending.append(entry)
+            self._condition.notify()
+        if not entry.flushed.wait(self.timeout):
+            with self._condition:
+                queued = entry in self._pending
+                if queued:
+                    self._pending.remove(entry)
+            if queued:
+                self.logger.warning('Timeout while waiting for the confirmation flusher, storing directly')
+                self._write([instance])
+                return instance
+            while not entry.flushed.wait(self.timeout):
+                if not self._flusher.is_alive():
+                    raise DatabaseError('Confirmation flusher died while storing a batch')
+        if entry.error is not None:
+            raise DatabaseError('Failed to store confirmation: %s' % entry.error)
+        return instance
+
+    def _start_flusher(self):
+        if self._flusher is None or not self._flusher.is_alive():
+            self._flusher = threading.Thread(target=self._run, name='viveum-confirmation-flusher')
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = time.time() + self.max_delay
+                while len(self._pending) < self.batch_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+            self._flush(batch)
+
+    def _flush(self, batch):
+        # request signals never fire on this thread, so stale connections must be closed here
+        try:
+            close_old_connections = getattr(db, 'close_old_connections', None)
+            if close_old_connections:
+                close_old_connections()
+            try:
+                self._write([entry.instance for entry in batch])
+            except Exception as exception:
+                self.logger.warning('Failed to store a batch of %d confirmations, retrying one by one: %s',
+                    len(batch), exception.__str__())
+                connection.close()
+                for entry in batch:
+                    self._flush_entry(entry)
+        finally:
+            for entry in batch:
+                entry.flushed.set()
+
+    def _flush_entry(self, entry):
+        try:
+            self._write([entry.instance])
+        except Exception as exception:
+            self.logger.exception('Failed to store confirmation for order %s',
+                entry.instance.order_id)
+            connection.close()
+            entry.error = exception
+
+    def _write(self, instances):
+        with transaction.commit_on_success():
+            Confirmation.objects.bulk_create(instances)
+            PaymentStatistic.objects.add_confirmations(instances)
+
+
+_confirmation_buffer = None
+_confirmation_buffer_lock = threading.Lock()
+
+
+def get_confirmation_buffer():
+    """
+    Return the process wide ConfirmationBuffer, configured through the settings
+    ``BATCH_SIZE``, ``BATCH_MAX_DELAY`` and ``BATCH_TIMEOUT`` in ``VIVEUM_PAYMENT``.
+    """
+    global _confirmation_buffer
+    with _confirmation_buffer_lock:
+        if _confirmation_buffer is None:
+            _confirmation_buffer = ConfirmationBuffer(
+                batch_size=settings.VIVEUM_PAYMENT.get('BATCH_SIZE', 100),
+                max_delay=settings.VIVEUM_PAYMENT.get('BATCH_MAX_DELAY', 0.05),
+                timeout=settings.VIVEUM_PAYMENT.get('BATCH_TIMEOUT', 10))
+        return _confirmation_buffer
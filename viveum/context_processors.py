@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
 from django.conf import settings
+from django.utils.functional import lazy
+
+
+def _get_order_standard_url():
+    return settings.VIVEUM_PAYMENT.get('ORDER_STANDARD_URL') or ''
+
+_order_standard_url = lazy(_get_order_standard_url, unicode)()
 
 
 def viveum(request):
     """
     Adds additional context variables to the default context.
+    This context processor is optional, since ``proceed_payment_view`` passes
+    VIVEUM_ORDER_STANDARD_URL to its template. It is kept for templates relying on it
+    and only looks up the setting, if the variable actually is rendered.
     """
     return {
-        'VIVEUM_ORDER_STANDARD_URL': settings.VIVEUM_PAYMENT.get('ORDER_STANDARD_URL'),
+        'VIVEUM_ORDER_STANDARD_URL': _order_standard_url,
     }
@@ -24,3 +24,4 @@ class ConfirmationForm(forms.ModelForm):
 
     orderid = forms.IntegerField()
     shasign = forms.CharField(min_length=40)
+    alias = forms.CharField(max_length=50, required=False)
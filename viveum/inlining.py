@@ -0,0 +1,147 @@
+#-*- coding: utf-8 -*-
+import base64
+import logging
+import mimetypes
+import os
+import re
+import urlparse
+from django.conf import settings
+from django.contrib.staticfiles import finders
+
+PAYMENT_ZONE_MARKER = '$$$PAYMENT ZONE$$$'
+
+
+class AssetInliner(object):
+    """
+    Turns the rendered payment zone template into one self-contained document, so
+    that the customer's browser does not have to fetch anything else from our
+    servers, while being on the PSP's payment page:
+    - stylesheets referenced by ``<link rel="stylesheet">`` are embedded as ``<style>``,
+    - images up to ``max_image_size`` bytes are embedded as data URIs,
+    - comments and redundant whitespace are stripped.
+    Only files found locally through STATIC_URL or MEDIA_URL are inlined, all other
+    references are left untouched.
+    """
+    STYLESHEET_RE = re.compile(r'<link\b[^>]*\brel=["\']?stylesheet\b[^>]*>', re.I)
+    HREF_RE = re.compile(r'\bhref=(["\']?)([^"\'\s>]+)\1', re.I)
+    MEDIA_RE = re.compile(r'\bmedia=(?:"([^"]*)"|\'([^\']*)\'|([^\s>]+))', re.I)
+    IMG_SRC_RE = re.compile(r'(<img\b[^>]*\bsrc=)(["\']?)([^"\'\s>]+)\2', re.I)
+    CSS_URL_RE = re.compile(r'url\(\s*(["\']?)([^"\')]+)\1\s*\)', re.I)
+    RAW_BLOCK_RE = re.compile(r'(<(style|script|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)', re.I | re.S)
+    HTML_COMMENT_RE = re.compile(r'<!--(?!\[if\b).*?-->', re.S)
+    CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+
+    def __init__(self, request, max_image_size=4096):
+        self.request = request
+        self.max_image_size = max_image_size
+        self.logger = logging.getLogger(__name__)
+        self.page_url = request.build_absolute_uri()
+
+    def inline(self, html):
+        """
+        Return the self-contained document, or the given html unchanged, if inlining
+        fails, since the PSP fetches this template for every payment.
+        """
+        try:
+            return self._inline(html)
+        except Exception:
+            self.logger.exception('Failed to inline assets, serving template unchanged')
+            return html
+
+    def _inline(self, html):
+        result = self.STYLESHEET_RE.sub(self._inline_stylesheet, html)
+        result = self.IMG_SRC_RE.sub(self._inline_image, result)
+        result = self._minify(result)
+        if PAYMENT_ZONE_MARKER in html and PAYMENT_ZONE_MARKER not in result:
+            self.logger.error('Inlining removed the payment zone marker, serving template unchanged')
+            return html
+        return result
+
+    def _inline_stylesheet(self, match):
+        href = self.HREF_RE.search(match.group(0))
+        if not href:
+            return match.group(0)
+        url = urlparse.urljoin(self.page_url, href.group(2))
+        content = self._read_local_file(url)
+        if content is None:
+            return match.group(0)
+        css = self._rewrite_css_urls(content.decode('utf-8'), url)
+        media = self.MEDIA_RE.search(match.group(0))
+        if media:
+            media = media.group(1) or media.group(2) or media.group(3)
+            return '<style type="text/css" media="%s">%s</style>' % (media, css)
+        return '<style type="text/css">%s</style>' % css
+
+    def _inline_image(self, match):
+        url = urlparse.urljoin(self.page_url, match.group(3))
+        return '%s%s%s%s' % (match.group(1), match.group(2), self._get_data_uri(url) or match.group(3),
+                             match.group(2))
+
+    def _rewrite_css_urls(self, css, base_url):
+        """
+        Embed small images referenced by the stylesheet and make all other references
+        absolute, since the stylesheet now is part of a page served by the PSP.
+        """
+        def rewrite(match):
+            if match.group(2).startswith('data:'):
+                return match.group(0)
+            url = urlparse.urljoin(base_url, match.group(2))
+            return 'url(%s)' % (self._get_data_uri(url) or url)
+        return self.CSS_URL_RE.sub(rewrite, css)
+
+    def _get_data_uri(self, url):
+        content = self._read_local_file(url, self.max_image_size)
+        mimetype = mimetypes.guess_type(urlparse.urlparse(url).path)[0]
+        if content is None or not mimetype or not mimetype.startswith('image/'):
+            return None
+        return 'data:%s;base64,%s' % (mimetype, base64.b64encode(content))
+
+    def _read_local_file(self, url, max_size=None):
+        filename = self._find_local_file(url)
+        if not filename or (max_size is not None and os.path.getsize(filename) > max_size):
+            return None
+        with open(filename, 'rb') as fh:
+            return fh.read()
+
+    def _find_local_file(self, url):
+        urlobj = urlparse.urlparse(url)
+        if urlobj.netloc and urlobj.netloc != self.request.get_host():
+            return None
+        for urlkey, rootkey in (('STATIC_URL', 'STATIC_ROOT'), ('MEDIA_URL', 'MEDIA_ROOT')):
+            prefix = urlparse.urlparse(getattr(settings, urlkey, None) or '').path
+            if not prefix or not urlobj.path.startswith(prefix):
+                continue
+            relpath = urlobj.path[len(prefix):]
+            if urlkey == 'STATIC_URL':
+                filename = finders.find(relpath)
+                if filename:
+                    return filename
+            root = getattr(settings, rootkey, None)
+            if root:
+                filename = os.path.normpath(os.path.join(root, relpath))
+                if filename.startswith(os.path.normpath(root) + os.sep) and os.path.isfile(filename):
+                    return filename
+        return None
+
+    def _minify(self, html):
+        parts, position = [], 0
+        for match in self.RAW_BLOCK_RE.finditer(html):
+            parts.append(self._minify_html(html[position:match.start()]))
+            content = match.group(3)
+            if match.group(2).lower() == 'style':
+                content = self._minify_css(self._rewrite_css_urls(content, self.page_url))
+            parts.append(match.group(1) + content + match.group(4))
+            position = match.end()
+        parts.append(self._minify_html(html[position:]))
+        return ''.join(parts)
+
+    def _minify_html(self, html):
+        html = self.HTML_COMMENT_RE.sub('', html)
+        html = re.sub(r'>\s*\n\s*<', '><', html)
+        return re.sub(r'\s+', ' ', html)
+
+    def _minify_css(self, css):
+        css = css.replace('<!--', '').replace('-->', '')
+        css = self.CSS_COMMENT_RE.sub('', css)
+        css = re.sub(r'\s+', ' ', css)
+        return re.sub(r'\s*([{};,])\s*', r'\1', css).strip()
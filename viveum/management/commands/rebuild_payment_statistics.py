@@ -0,0 +1,13 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from viveum.models import PaymentStatistic
+
+
+class Command(NoArgsCommand):
+    help = 'Recompute the aggregated payment statistics from all stored confirmations.'
+
+    def handle_noargs(self, **options):
+        with transaction.commit_on_success():
+            PaymentStatistic.objects.rebuild()
+        self.stdout.write('Rebuilt %d payment statistic rows\n' % PaymentStatistic.objects.count())
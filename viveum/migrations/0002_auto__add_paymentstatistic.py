@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'PaymentStatistic'
+        db.create_table('viveum_paymentstatistic', (
+            ('id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('day', self.gf('django.db.models.fields.DateField')(db_index=True)),
+            ('brand', self.gf('django.db.models.fields.CharField')(max_length=25)),
+            ('status', self.gf('django.db.models.fields.IntegerField')()),
+            ('ncerror', self.gf('django.db.models.fields.IntegerField')()),
+            ('currency', self.gf('django.db.models.fields.CharField')(max_length=3)),
+            ('count', self.gf('django.db.models.fields.PositiveIntegerField')(default=0)),
+            ('amount', self.gf('django.db.models.fields.DecimalField')(default='0.0', max_digits=30, decimal_places=2)),
+        ))
+        db.send_create_signal('viveum', ['PaymentStatistic'])
+
+        # Adding unique constraint on 'PaymentStatistic', fields ['day', 'brand', 'status', 'ncerror', 'currency']
+        db.create_unique('viveum_paymentstatistic', ['day', 'brand', 'status', 'ncerror', 'currency'])
+
+
+    def backwards(self, orm):
+        # Removing unique constraint on 'PaymentStatistic', fields ['day', 'brand', 'status', 'ncerror', 'currency']
+        db.delete_unique('viveum_paymentstatistic', ['day', 'brand', 'status', 'ncerror', 'currency'])
+
+        # Deleting model 'PaymentStatistic'
+        db.delete_table('viveum_paymentstatistic')
+
+
+    models = {
+        'auth.group': {
+            'Meta': {'object_name': 'Group'},
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '80'}),
+            'permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'})
+        },
+        'auth.permission': {
+            'Meta': {'ordering': "('content_type__app_label', 'content_type__model', 'codename')", 'unique_together': "(('content_type', 'codename'),)", 'object_name': 'Permission'},
+            'codename': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'content_type': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['contenttypes.ContentType']"}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '50'})
+        },
+        'auth.user': {
+            'Meta': {'object_name': 'User'},
+            'date_joined': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'email': ('django.db.models.fields.EmailField', [], {'max_length': '75', 'blank': 'True'}),
+            'first_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'groups': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Group']", 'symmetrical': 'False', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'is_active': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'is_staff': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'is_superuser': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'last_login': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'}),
+            'last_name': ('django.db.models.fields.CharField', [], {'max_length': '30', 'blank': 'True'}),
+            'password': ('django.db.models.fields.CharField', [], {'max_length': '128'}),
+            'user_permissions': ('django.db.models.fields.related.ManyToManyField', [], {'to': "orm['auth.Permission']", 'symmetrical': 'False', 'blank': 'True'}),
+            'username': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '30'})
+        },
+        'contenttypes.contenttype': {
+            'Meta': {'ordering': "('name',)", 'unique_together': "(('app_label', 'model'),)", 'object_name': 'ContentType', 'db_table': "'django_content_type'"},
+            'app_label': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'model': ('django.db.models.fields.CharField', [], {'max_length': '100'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '100'})
+        },
+        'synthesa.order': {
+            'Meta': {'object_name': 'Order'},
+            'billing_address_text': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'cart_pk': ('django.db.models.fields.PositiveIntegerField', [], {'null': 'True', 'blank': 'True'}),
+            'created': ('django.db.models.fields.DateTimeField', [], {'auto_now_add': 'True', 'blank': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'modified': ('django.db.models.fields.DateTimeField', [], {'auto_now': 'True', 'blank': 'True'}),
+            'order_subtotal': ('django.db.models.fields.DecimalField', [], {'default': "'0.0'", 'max_digits': '30', 'decimal_places': '2'}),
+            'order_total': ('django.db.models.fields.DecimalField', [], {'default': "'0.0'", 'max_digits': '30', 'decimal_places': '2'}),
+            'shipping_address_text': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'status': ('django.db.models.fields.IntegerField', [], {'default': '10'}),
+            'user': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['auth.User']", 'null': 'True', 'blank': 'True'})
+        },
+        'viveum.confirmation': {
+            'Meta': {'object_name': 'Confirmation'},
+            'acceptance': ('django.db.models.fields.CharField', [], {'max_length': '20', 'blank': 'True'}),
+            'amount': ('django.db.models.fields.DecimalField', [], {'default': "'0.0'", 'max_digits': '30', 'decimal_places': '2'}),
+            'brand': ('django.db.models.fields.CharField', [], {'max_length': '25'}),
+            'cardno': ('django.db.models.fields.CharField', [], {'max_length': '21'}),
+            'cn': ('django.db.models.fields.CharField', [], {'max_length': '255'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ipcty': ('django.db.models.fields.CharField', [], {'max_length': '2', 'blank': 'True'}),
+            'merchant_comment': ('django.db.models.fields.TextField', [], {'null': 'True', 'blank': 'True'}),
+            'ncerror': ('django.db.models.fields.IntegerField', [], {}),
+            'order': ('django.db.models.fields.related.ForeignKey', [], {'to': "orm['synthesa.Order']"}),
+            'origin': ('django.db.models.fields.CharField', [], {'max_length': '10'}),
+            'payid': ('django.db.models.fields.IntegerField', [], {}),
+            'status': ('django.db.models.fields.IntegerField', [], {})
+        },
+        'viveum.paymentstatistic': {
+            'Meta': {'unique_together': "(('day', 'brand', 'status', 'ncerror', 'currency'),)", 'object_name': 'PaymentStatistic'},
+            'amount': ('django.db.models.fields.DecimalField', [], {'default': "'0.0'", 'max_digits': '30', 'decimal_places': '2'}),
+            'brand': ('django.db.models.fields.CharField', [], {'max_length': '25'}),
+            'count': ('django.db.models.fields.PositiveIntegerField', [], {'default': '0'}),
+            'currency': ('django.db.models.fields.CharField', [], {'max_length': '3'}),
+            'day': ('django.db.models.fields.DateField', [], {'db_index': 'True'}),
+            'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'ncerror': ('django.db.models.fields.IntegerField', [], {}),
+            'status': ('django.db.models.fields.IntegerField', [], {})
+        }
+    }
+
+    complete_apps = ['viveum']
\ No newline at end of file
@@ -1,6 +1,9 @@
 #-*- coding: utf-8 -*-
+from decimal import Decimal
+from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
+from django.db.models import F
 from shop.util.fields import CurrencyField
 from shop.models import Order
 
@@ -41,3 +44,85 @@ class Confirmation(models.Model):
     @staticmethod
     def get_meta_fields():
         return Confirmation._meta.fields
+
+
+class PaymentStatisticManager(models.Manager):
+    def add_confirmations(self, confirmations):
+        """
+        Incrementally add the given, already stored confirmations to their aggregates.
+        """
+        order_dates = dict(Order.objects.filter(pk__in=set(c.order_id for c in confirmations))
+                           .values_list('id', 'created'))
+        rows = [(order_dates[c.order_id], c.brand, c.status, c.ncerror, c.currency, c.amount)
+                for c in confirmations]
+        for key, (count, amount) in self._aggregate(rows).iteritems():
+            day, brand, status, ncerror, currency = key
+            statistic, _ = self.get_or_create(day=day, brand=brand, status=status,
+                ncerror=ncerror, currency=currency, defaults={'count': 0, 'amount': Decimal('0')})
+            self.filter(pk=statistic.pk).update(count=F('count') + count,
+                                                amount=F('amount') + amount)
+
+    def rebuild(self):
+        """
+        Discard all aggregates and recompute them from the stored confirmations.
+        """
+        self.all().delete()
+        rows = Confirmation.objects.values_list('order__created', 'brand', 'status',
+            'ncerror', 'currency', 'amount').iterator()
+        self.bulk_create([self.model(day=key[0], brand=key[1], status=key[2], ncerror=key[3],
+                currency=key[4], count=count, amount=amount)
+            for key, (count, amount) in self._aggregate(rows).iteritems()])
+
+    def _aggregate(self, rows):
+        totals = {}
+        for created, brand, status, ncerror, currency, amount in rows:
+            key = (created.date(), brand, status, ncerror, currency)
+            count, total = totals.get(key, (0, Decimal('0')))
+            totals[key] = (count + 1, total + amount)
+        return totals
+
+
+class PaymentStatistic(models.Model):
+    """
+    Aggregated confirmations per day, brand, status, error code and currency. These
+    rows are updated whenever a confirmation is stored, so that reports do not have
+    to scan the whole Confirmation table.
+    """
+    class Meta:
+        verbose_name = _('Viveum Payment Statistic')
+        unique_together = ('day', 'brand', 'status', 'ncerror', 'currency')
+
+    day = models.DateField(db_index=True,
+        verbose_name=_('Day the order was placed'))
+    brand = models.CharField(max_length=25,
+        verbose_name=_('Brand of a credit/debit/purchasing card'))
+    status = models.IntegerField(
+        verbose_name=_('The PSP\'s return status'))
+    ncerror = models.IntegerField(
+        verbose_name=_('The PSP\'s error code'))
+    currency = models.CharField(max_length=3,
+        verbose_name=_('Currency of the transaction'))
+    count = models.PositiveIntegerField(default=0,
+        verbose_name=_('Number of confirmations'))
+    amount = CurrencyField()
+
+    objects = PaymentStatisticManager()
+
+
+class CustomerAlias(models.Model):
+    """
+    The alias issued by the PSP for the card a customer used on his last successful
+    payment. It is sent along with subsequent payments, so that returning customers
+    do not have to enter their card data again.
+    """
+    class Meta:
+        verbose_name = _('Viveum Customer Alias')
+
+    user = models.OneToOneField(getattr(settings, 'AUTH_USER_MODEL', 'auth.User'),
+        verbose_name=_('Customer'))
+    alias = models.CharField(max_length=50,
+        verbose_name=_('Alias issued by the PSP'))
+    brand = models.CharField(max_length=25, blank=True,
+        verbose_name=_('Brand of a credit/debit/purchasing card'))
+    cardno = models.CharField(max_length=21, blank=True,
+        verbose_name=_('The last 4 digits of the customers credit card number'))
@@ -7,13 +7,15 @@ from django.conf.urls import patterns, url
 from django.contrib.sites.models import get_current_site
 from django.core.urlresolvers import reverse
 from django.core.exceptions import SuspiciousOperation, ValidationError
+from django.db import transaction
 from django.shortcuts import render_to_response
 from django.contrib.auth.models import AnonymousUser
 from django.template import RequestContext
 from django.http import HttpResponseRedirect, HttpResponseBadRequest, HttpResponseServerError
 from shop.util.address import get_billing_address_from_request
+from batching import get_confirmation_buffer
 from forms import OrderStandardForm, ConfirmationForm
-from models import Confirmation
+from models import Confirmation, PaymentStatistic, CustomerAlias
 from views import PaymentZoneView
 
 
@@ -36,9 +38,9 @@ class OffsiteViveumBackend(object):
     SHA_IN_PARAMETERS = set(('AMOUNT', 'BRAND', 'CURRENCY', 'CN', 'EMAIL', 'TP',
         'LANGUAGE', 'ORDERID', 'PSPID', 'TITLE', 'PM', 'OWNERZIP', 'OWNERADDRESS',
         'OWNERADDRESS2', 'OWNERTOWN', 'OWNERCTY', 'ACCEPTURL', 'DECLINEURL',
-        'EXCEPTIONURL', 'CANCELURL', 'COM'))
+        'EXCEPTIONURL', 'CANCELURL', 'COM', 'ALIAS', 'ALIASUSAGE', 'ALIASOPERATION'))
     SHA_OUT_PARAMETERS = set(('ACCEPTANCE', 'AMOUNT', 'CARDNO', 'CN', 'CURRENCY',
-         'IP', 'NCERROR', 'ORDERID', 'PAYID', 'STATUS', 'BRAND'))
+         'IP', 'NCERROR', 'ORDERID', 'PAYID', 'STATUS', 'BRAND', 'ALIAS'))
     CONFIRMATION_PARAMETERS = [f.name for f in Confirmation.get_meta_fields()]
 
     def __init__(self, shop):
@@ -65,7 +67,10 @@ class OffsiteViveumBackend(object):
         form_dict = self.get_form_dict(request)
         self.sign_form_dict(form_dict)
         order_form = OrderStandardForm(initial=form_dict)
-        request_context = RequestContext(request, {'order_form': order_form})
+        request_context = RequestContext(request, {
+            'order_form': order_form,
+            'VIVEUM_ORDER_STANDARD_URL': settings.VIVEUM_PAYMENT.get('ORDER_STANDARD_URL'),
+        })
         self.logger.info('Passing POST parameters to Viveum-PSP: %s', form_dict.__str__())
         return render_to_response('viveum/order_form.html', request_context)
 
@@ -80,7 +85,7 @@ class OffsiteViveumBackend(object):
             email = request.user.email
         url_scheme = 'https://%s%s' if request.is_secure() else 'http://%s%s'
         domain = get_return_domain(request)
-        return {
+        form_dict = {
             'PSPID': settings.VIVEUM_PAYMENT.get('PSPID'),
             'CURRENCY': settings.VIVEUM_PAYMENT.get('CURRENCY'),
             'LANGUAGE': settings.VIVEUM_PAYMENT.get('LANGUAGE'),
@@ -99,6 +104,24 @@ class OffsiteViveumBackend(object):
             'ACCEPTURL': url_scheme % (domain, reverse('viveum_accept')),
             'DECLINEURL': url_scheme % (domain, reverse('viveum_decline')),
         }
+        form_dict.update(self.get_alias_dict(request))
+        return form_dict
+
+    def get_alias_dict(self, request):
+        """
+        If ``USE_ALIAS`` is set, ask the PSP to issue an alias for a customer paying the
+        first time, and send the stored alias for a returning customer, so that he does
+        not have to enter his card data again.
+        """
+        if not settings.VIVEUM_PAYMENT.get('USE_ALIAS', False) or \
+                not request.user or isinstance(request.user, AnonymousUser):
+            return {}
+        alias_dict = {'ALIASUSAGE': settings.VIVEUM_PAYMENT.get('ALIAS_USAGE', '')}
+        try:
+            alias_dict['ALIAS'] = CustomerAlias.objects.get(user=request.user).alias
+        except CustomerAlias.DoesNotExist:
+            alias_dict['ALIASOPERATION'] = 'BYPSP'
+        return alias_dict
 
     def sign_form_dict(self, form_dict):
         form_dict['SHASIGN'] = self._get_sha_sign(form_dict,
@@ -123,7 +146,7 @@ class OffsiteViveumBackend(object):
         })
         confirmation = ConfirmationForm(query_dict)
         if confirmation.is_valid():
-            confirmation.save()
+            self._save_confirmation(confirmation)
         else:
             raise ValidationError('Confirmation sent by PSP did not validate: %s' % confirmation.errors)
         shaoutsign = self._get_sha_sign(query_dict, self.SHA_OUT_PARAMETERS,
@@ -134,6 +157,34 @@ class OffsiteViveumBackend(object):
             confirmation.cleaned_data['status'], confirmation.cleaned_data['orderid'])
         return confirmation
 
+    def _save_confirmation(self, confirmation):
+        """
+        Store the validated confirmation, either immediately or, if ``BATCH_CONFIRMATIONS``
+        is set, through the write-coalescing buffer. In both cases this method returns
+        only after the confirmation and its payment statistics have been committed.
+        """
+        if settings.VIVEUM_PAYMENT.get('BATCH_CONFIRMATIONS', False):
+            return get_confirmation_buffer().save(confirmation.save(commit=False))
+        with transaction.commit_on_success():
+            instance = confirmation.save()
+            PaymentStatistic.objects.add_confirmations([instance])
+        return instance
+
+    def _store_alias(self, confirmation):
+        """
+        Remember the alias the PSP issued for the customer of a successful payment.
+        """
+        alias = confirmation.cleaned_data.get('alias')
+        user = confirmation.cleaned_data['order'].user
+        if not alias or user is None:
+            return
+        customer_alias, created = CustomerAlias.objects.get_or_create(user=user,
+            defaults={'alias': alias})
+        customer_alias.alias = alias
+        customer_alias.brand = confirmation.cleaned_data['brand']
+        customer_alias.cardno = confirmation.cleaned_data['cardno']
+        customer_alias.save()
+
     def return_success_view(self, request, origin):
         """
         The view the customer is redirected to from the PSP after he performed
@@ -150,6 +201,12 @@ class OffsiteViveumBackend(object):
             self.shop.confirm_payment(confirmation.cleaned_data['order'],
                 confirmation.cleaned_data['amount'],
                 confirmation.cleaned_data['payid'], self.backend_name)
+            try:
+                self._store_alias(confirmation)
+            except Exception as exception:
+                # the order already is paid, so do not report an error to the PSP
+                self.logger.error('%s while storing alias for order %s', exception.__str__(),
+                    confirmation.cleaned_data['orderid'])
             return HttpResponseRedirect(self.shop.get_finished_url())
         except Exception as exception:
             # since this response is sent back to the PSP, catch errors locally
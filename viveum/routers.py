@@ -0,0 +1,48 @@
+#-*- coding: utf-8 -*-
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+
+_reporting_state = threading.local()
+
+
+def get_replica_database():
+    """
+    Return the alias of the database configured as ``REPLICA_DATABASE`` in
+    ``VIVEUM_PAYMENT``, or None if reporting queries shall hit the primary database.
+    """
+    return settings.VIVEUM_PAYMENT.get('REPLICA_DATABASE')
+
+
+@contextmanager
+def reporting():
+    """
+    Inside this block, read-only queries on the models of this app, such as admin
+    listings, exports or reports, are sent to the replica database by ConfirmationRouter.
+    """
+    previous = getattr(_reporting_state, 'active', False)
+    _reporting_state.active = True
+    try:
+        yield
+    finally:
+        _reporting_state.active = previous
+
+
+class ConfirmationRouter(object):
+    """
+    Database router, which sends reads on the models of this app to the replica database,
+    but only inside a ``reporting()`` block. Everything else, especially the payment views
+    storing and verifying confirmations, as well as all writes, are left to the other
+    routers or the primary database.
+    Add ``viveum.routers.ConfirmationRouter`` to DATABASE_ROUTERS to activate it.
+    """
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'viveum' and getattr(_reporting_state, 'active', False):
+            return get_replica_database()
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        replica = get_replica_database()
+        if replica and replica in (obj1._state.db, obj2._state.db):
+            return True
+        return None
@@ -4,6 +4,7 @@ from django.template.loader import render_to_string
 from django.views.generic import TemplateView
 from django.template.context import RequestContext
 from django.http import HttpResponse
+from inlining import AssetInliner
 
 
 class PaymentZoneView(TemplateView):
@@ -30,9 +31,14 @@ class PaymentZoneView(TemplateView):
         """
         Replaces all UTF-8 characters by HTML Decimal's since the Viveum template
         rendering engine otherwise gets confused.
+        If ``INLINE_PAYMENT_ZONE`` is set, local stylesheets and small images are embedded
+        and the document is minified, so that the customer does not have to fetch them.
         """
         context = self.get_context_data(**kwargs)
         html = render_to_string(self.get_template_names(), context_instance=context)
+        if settings.VIVEUM_PAYMENT.get('INLINE_PAYMENT_ZONE', False):
+            max_image_size = settings.VIVEUM_PAYMENT.get('INLINE_IMAGE_MAX_SIZE', 4096)
+            html = AssetInliner(self.request, max_image_size).inline(html)
         return HttpResponse(html.encode('ascii', 'xmlcharrefreplace'))
 
     def _update_context_for_urlkey(self, context, urlkey):